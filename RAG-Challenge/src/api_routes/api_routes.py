@@ -1,15 +1,26 @@
 """API routes for document upload, chat session, and question answering."""
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Response, Header
+from fastapi.responses import PlainTextResponse
 from typing import List
 from src.services import embeddings, rag_pipeline
-from src.models.models import AIResponse, UploadResponse, QuestionRequest
+from src.models.models import (
+    AIResponse,
+    UploadResponse,
+    QuestionRequest,
+    ReadinessResponse,
+    SnapshotRequest,
+    RestoreRequest,
+    SnapshotResponse,
+)
+from src.services.ollama_client import residency
+from src.services import profiler
 import os
 import uuid
 from src.services.rag_pipeline import new_chat
 
 
-router = APIRouter()
+router = APIRouter(route_class=profiler.ProfiledRoute)
 
 
 @router.post("/start_chat", response_model=dict)
@@ -75,3 +86,97 @@ async def ask_question(payload: QuestionRequest) -> AIResponse:
         answer=answer_data["answer"],
         references=answer_data["references"],
     )
+
+
+@router.get("/ready", response_model=ReadinessResponse)
+def ready(response: Response) -> ReadinessResponse:
+    """
+    Report whether the LLM is loaded in Ollama, with cold vs. warm latency stats.
+
+    Returns 503 until the model is resident in memory.
+    """
+    state = residency.refresh_state()
+    if state != "loaded":
+        response.status_code = 503
+    return ReadinessResponse(
+        ready=state == "loaded",
+        model=residency.model,
+        state=state,
+        last_error=residency.last_error,
+        last_preload_s=residency.last_preload_s,
+        latency=residency.stats(),
+    )
+
+
+@router.get("/snapshots", response_model=List[str])
+def list_snapshots() -> List[str]:
+    """List the index snapshots available on this node."""
+    return embeddings.list_snapshots()
+
+
+@router.post("/snapshots", response_model=SnapshotResponse)
+def create_snapshot(payload: SnapshotRequest) -> SnapshotResponse:
+    """
+    Export a session's vectors, payloads and chunk texts to a named local snapshot.
+
+    Args:
+        payload (SnapshotRequest): Contains the session_id and snapshot name.
+
+    Returns:
+        SnapshotResponse: The snapshot name, session and number of exported points.
+    """
+    try:
+        points = embeddings.snapshot_session(payload.session_id, payload.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SnapshotResponse(name=payload.name, session_id=payload.session_id, points=points)
+
+
+@router.post("/snapshots/{name}/restore", response_model=SnapshotResponse)
+def restore_snapshot(name: str, payload: RestoreRequest) -> SnapshotResponse:
+    """
+    Bulk-import a named snapshot into a session without re-embedding its documents.
+
+    Args:
+        name (str): The snapshot name.
+        payload (RestoreRequest): Contains the session_id to restore into.
+
+    Returns:
+        SnapshotResponse: The snapshot name, session and number of restored points.
+    """
+    try:
+        points = embeddings.restore_snapshot(name, payload.session_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SnapshotResponse(name=name, session_id=payload.session_id, points=points)
+
+
+def _check_admin(token: str | None):
+    if not profiler.PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling admin is disabled (PROFILE_ADMIN_TOKEN is not set).")
+    if not profiler.is_admin(token):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@router.get("/admin/profiles", response_model=List[dict])
+def list_profiles(x_admin_token: str | None = Header(default=None)):
+    """List the most recent request profiles (without their stacks)."""
+    _check_admin(x_admin_token)
+    return profiler.profiles.summaries()
+
+
+@router.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str, x_admin_token: str | None = Header(default=None)):
+    """
+    Return a request profile as folded stacks, ready for flamegraph.pl or speedscope.
+
+    Args:
+        profile_id (str): The id returned in the X-Profile-Id response header.
+    """
+    _check_admin(x_admin_token)
+    profile = profiler.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return profile["folded"]
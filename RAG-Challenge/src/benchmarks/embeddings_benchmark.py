@@ -0,0 +1,118 @@
+"""Benchmark embedding backends (throughput, memory and parity).
+
+Run from the repository root (as in the container, with ``PYTHONPATH=RAG-Challenge``)::
+
+    PYTHONPATH=RAG-Challenge python -m src.benchmarks.embeddings_benchmark case_files/LB5001.pdf --backends torch onnx
+"""
+
+import argparse
+import gc
+import multiprocessing as mp
+import os
+import resource
+import time
+
+import numpy as np
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_backend(backend: str, texts: list, repeats: int, queue):
+    # Select the backend before the embeddings module loads its model
+    os.environ["EMBEDDING_BACKEND"] = backend
+    os.environ["EMBEDDING_WORKER_SOCKET"] = ""
+    rss_start = _rss_mb()
+    t0 = time.perf_counter()
+    from src.services import embeddings
+
+    gc.collect()
+    load_s = time.perf_counter() - t0
+    rss_loaded = _rss_mb()
+
+    embeddings.encode_texts(texts[:8])  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        embs = embeddings.encode_texts(texts)
+    batch_s = (time.perf_counter() - t0) / repeats
+
+    t0 = time.perf_counter()
+    for text in texts[:50]:
+        embeddings.encode_texts([text])
+    query_ms = (time.perf_counter() - t0) / min(len(texts), 50) * 1000
+
+    queue.put(
+        {
+            "backend": backend,
+            "effective_backend": embeddings.get_model().backend,
+            "load_s": load_s,
+            "texts_per_s": len(texts) / batch_s,
+            "query_ms": query_ms,
+            "model_rss_mb": rss_loaded - rss_start,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "embeddings": embs,
+        }
+    )
+
+
+def _prepare_onnx():
+    os.environ["EMBEDDING_BACKEND"] = "onnx"
+    os.environ["EMBEDDING_WORKER_SOCKET"] = ""
+    from src.services import embeddings  # noqa: F401  (exports the model on first load)
+
+
+def _load_texts(paths: list) -> list:
+    from src.services import pdf_parser
+
+    texts = []
+    for path in paths:
+        texts.extend(c["text"] for c in pdf_parser.extract_text_and_chunk(path))
+    return texts
+
+
+def main():
+    """Run each backend in a fresh process and print a comparison table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="+", help="PDF files providing the texts to encode")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = _load_texts(args.pdfs)
+    ctx = mp.get_context("spawn")
+    if "onnx" in args.backends:
+        # Export and check parity up front, so the measured run loads only the quantized model
+        proc = ctx.Process(target=_prepare_onnx)
+        proc.start()
+        proc.join()
+    results = []
+    for backend in args.backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_backend, args=(backend, texts, args.repeats, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+
+    print(f"{len(texts)} texts")
+    print(f"{'backend':<10}{'actual':<10}{'load s':>9}{'texts/s':>10}{'query ms':>10}{'model MB':>10}{'peak MB':>10}{'min cos':>9}")
+    ref = results[0]["embeddings"]
+    ref = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    for r in results:
+        embs = r["embeddings"] / np.linalg.norm(r["embeddings"], axis=1, keepdims=True)
+        min_cos = float(np.min(np.sum(embs * ref, axis=1)))
+        print(
+            f"{r['backend']:<10}{r['effective_backend']:<10}{r['load_s']:>9.2f}{r['texts_per_s']:>10.1f}"
+            f"{r['query_ms']:>10.2f}{r['model_rss_mb']:>10.0f}{r['peak_rss_mb']:>10.0f}{min_cos:>9.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark recall@k of PCA-reduced vectors against the unreduced index.
+
+Chunks of the given PDFs are embedded, a projection is fitted on them, and each query is
+answered three ways with exact (brute-force) search: full vectors (the reference), reduced
+vectors only, and reduced vectors rescored with the full ones (as QdrantStore.search does).
+Queries default to the first sentence of each chunk.
+
+Run from the repository root (as in the container, with ``PYTHONPATH=RAG-Challenge``)::
+
+    PYTHONPATH=RAG-Challenge python -m src.benchmarks.reduction_benchmark case_files/*.pdf --dims 64 96 128
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = [len(set(f) & set(t)) for f, t in zip(found, truth)]
+    return sum(hits) / truth.size
+
+
+def main():
+    """Print recall@k and stored bytes per vector for each reduced dimension."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="+", help="PDF files providing the corpus")
+    parser.add_argument("--dims", nargs="+", type=int, default=[32, 64, 96, 128, 192])
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--queries", help="Optional text file with one query per line")
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_WORKER_SOCKET"] = ""
+    from src.services import embeddings, pdf_parser
+    from src.vector_database.projection import PCAProjection
+    from src.vector_database.qdrant_store import MMR_FETCH_FACTOR, RESCORE_FACTOR
+
+    texts = [c["text"] for path in args.pdfs for c in pdf_parser.extract_text_and_chunk(path)]
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = [t.split(".")[0][:200] for t in texts]
+    corpus = embeddings.encode_texts(texts)
+    q = embeddings.encode_texts(queries)
+
+    k = min(args.k, len(texts))
+    fetch = min(k * MMR_FETCH_FACTOR, len(texts))
+    rescore = min(fetch * RESCORE_FACTOR, len(texts))
+    truth = _top_k(q @ corpus.T, k)
+
+    print(f"{len(texts)} chunks, {len(queries)} queries, k={k}, rescoring top {rescore}")
+    print(f"{'dim':>5}{'bytes/vec':>11}{'recall@k':>10}{'rescored':>10}")
+    print(f"{embeddings.DIM:>5}{embeddings.DIM * 4:>11}{1.0:>10.3f}{1.0:>10.3f}")
+    for dim in args.dims:
+        proj = PCAProjection.fit(corpus, dim)
+        reduced_scores = proj.transform(q) @ proj.transform(corpus).T
+        reduced = _top_k(reduced_scores, k)
+        candidates = _top_k(reduced_scores, rescore)
+        full_scores = np.take_along_axis(q @ corpus.T, candidates, axis=1)
+        rescored = np.take_along_axis(candidates, _top_k(full_scores, k), axis=1)
+        print(f"{dim:>5}{dim * 4:>11}{_recall(reduced, truth):>10.3f}{_recall(rescored, truth):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
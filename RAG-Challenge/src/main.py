@@ -1,13 +1,38 @@
 """Main entry point for the RAG Challenge FastAPI application."""
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import random
+import threading
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from src.api_routes.api_routes import router as api_router
+from src.services import embedding_worker, embeddings, leader, profiler
+from src.services.ollama_client import residency
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Preload the LLM and index snapshots; keep the LLM resident while the API is running."""
+    # One keep-alive pinger per node; other workers only read Ollama's state for /ready
+    if leader.acquire("ollama-residency"):
+        residency.start()
+    if embedding_worker.EMBEDDING_WORKER_SOCKET:
+        # Wait for the worker in the background; encodes block until this first wait ends
+        threading.Thread(target=embedding_worker.wait_for_startup, name="embedding-worker-wait", daemon=True).start()
+    # Once per node, not once per uvicorn worker, and without holding up startup
+    if leader.acquire("snapshot-preload"):
+        threading.Thread(target=embeddings.preload_snapshots, name="snapshot-preload", daemon=True).start()
+    yield
+    residency.stop()
+
 
 app = FastAPI(
     title="RAG Challenge API",
     description=("API to upload PDFs and questions via RAG with local LLM (Ollama)"),
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 # Allow access to Streamlit UI
@@ -19,5 +44,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """
+    Record a sampled stack profile for requests carrying the profiling header together with
+    the admin token, or for a random PROFILE_SAMPLE_RATE fraction of requests.
+    """
+    wanted = (
+        profiler.header_requests_profile(request.headers.get(profiler.PROFILE_HEADER))
+        and profiler.is_admin(request.headers.get("X-Admin-Token"))
+    ) or random.random() < profiler.PROFILE_SAMPLE_RATE
+    if not wanted or request.url.path.startswith("/admin/"):
+        return await call_next(request)
+
+    sampler = profiler.StackSampler()
+    token = profiler.activate(sampler)
+    sampler.start()
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        sampler.stop()
+        profiler.deactivate(token)
+        profile_id = profiler.profiles.add(
+            request.method, request.url.path, time.perf_counter() - t0, sampler
+        )
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
 # Include API routes
 app.include_router(api_router)
@@ -1,7 +1,7 @@
 """Pydantic models for question answering and document upload responses."""
 
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
 
 
 class QuestionRequest(BaseModel):
@@ -25,3 +25,35 @@ class UploadResponse(BaseModel):
     documents_indexed: int
     total_chunks: int
     indexed_points: int
+
+
+class ReadinessResponse(BaseModel):
+    """Response model for the LLM readiness check."""
+
+    ready: bool
+    model: str
+    state: str
+    last_error: Optional[str] = None
+    last_preload_s: Optional[float] = None
+    latency: Dict[str, Dict[str, Optional[float]]]
+
+
+class SnapshotRequest(BaseModel):
+    """Request model for exporting a session's index to a snapshot."""
+
+    session_id: str
+    name: str
+
+
+class RestoreRequest(BaseModel):
+    """Request model for restoring a snapshot into a session."""
+
+    session_id: str
+
+
+class SnapshotResponse(BaseModel):
+    """Response model for snapshot export and restore."""
+
+    name: str
+    session_id: str
+    points: int
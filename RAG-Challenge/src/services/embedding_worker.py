@@ -0,0 +1,228 @@
+"""Out-of-process embedding worker shared by all API worker processes.
+
+The worker owns the only copy of the embedding model. API processes send the texts
+over a local Unix socket together with the name of a shared-memory block they
+allocated; the worker batches concurrent requests, encodes them in one call and
+writes each result straight into its caller's block, so no float arrays are
+pickled over the socket.
+
+Start it next to the API with::
+
+    python -m src.services.embedding_worker
+"""
+
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Shared secret of the worker and its clients; requests are unpickled, so there is no default
+AUTHKEY = os.getenv("EMBEDDING_WORKER_AUTHKEY", "").encode()
+# Unix socket of the worker; empty (or no AUTHKEY) means every process loads its own model
+EMBEDDING_WORKER_SOCKET = os.getenv("EMBEDDING_WORKER_SOCKET", "") if AUTHKEY else ""
+if os.getenv("EMBEDDING_WORKER_SOCKET") and not AUTHKEY:
+    print("EMBEDDING_WORKER_AUTHKEY is not set; the embedding worker is disabled.")
+# Maximum number of texts encoded together, and how long to wait for a batch to fill
+BATCH_SIZE = int(os.getenv("EMBEDDING_WORKER_BATCH_SIZE", "64"))
+BATCH_WAIT_MS = float(os.getenv("EMBEDDING_WORKER_BATCH_WAIT_MS", "5"))
+# Seconds an API process waits for the worker socket at startup (the first onnx start exports the model)
+STARTUP_TIMEOUT = float(os.getenv("EMBEDDING_WORKER_STARTUP_TIMEOUT", "600"))
+
+
+class _Job:
+    def __init__(self, texts: list, shm_name: str):
+        self.texts = texts
+        self.shm_name = shm_name
+        self.error: str | None = None
+        self.done = threading.Event()
+
+
+class _Batcher:
+    """Collects concurrent encode requests and runs them through the model together."""
+
+    def __init__(self, encode, batch_size: int = BATCH_SIZE, wait_ms: float = BATCH_WAIT_MS):
+        self.encode = encode
+        self.batch_size = batch_size
+        self.wait = wait_ms / 1000
+        self.jobs: queue.Queue = queue.Queue()
+
+    def submit(self, texts: list, shm_name: str) -> _Job:
+        job = _Job(texts, shm_name)
+        self.jobs.put(job)
+        return job
+
+    def _collect(self) -> list:
+        batch = [self.jobs.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.wait
+        while size < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(job)
+            size += len(job.texts)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self._collect()
+            try:
+                embs = self.encode([t for job in batch for t in job.texts])
+            except Exception as e:
+                embs = None
+                for job in batch:
+                    job.error = str(e)
+            if embs is not None:
+                offset = 0
+                for job in batch:
+                    # One caller's vanished or undersized block must not fail the others
+                    try:
+                        _write_result(job.shm_name, embs[offset:offset + len(job.texts)])
+                    except Exception as e:
+                        job.error = str(e)
+                    offset += len(job.texts)
+            for job in batch:
+                job.done.set()
+
+
+def _write_result(shm_name: str, embs: np.ndarray):
+    shm = SharedMemory(name=shm_name)
+    # The client owns (and unlinks) the block; keep our tracker from touching it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    out = np.ndarray(embs.shape, dtype=np.float32, buffer=shm.buf)
+    out[:] = embs
+    del out
+    shm.close()
+
+
+def _handle(conn, batcher: _Batcher):
+    with conn:
+        while True:
+            try:
+                texts, shm_name = conn.recv()
+            except (EOFError, OSError):
+                return
+            job = batcher.submit(texts, shm_name)
+            job.done.wait()
+            conn.send(job.error)
+
+
+def serve(address: str = EMBEDDING_WORKER_SOCKET or "/tmp/rag-embed.sock"):
+    """
+    Load the embedding model and serve encode requests on a Unix socket until killed.
+
+    Args:
+        address (str, optional): Path of the Unix socket. Defaults to EMBEDDING_WORKER_SOCKET.
+
+    Raises:
+        RuntimeError: If EMBEDDING_WORKER_AUTHKEY is not set.
+    """
+    if not AUTHKEY:
+        raise RuntimeError("EMBEDDING_WORKER_AUTHKEY must be set to start the embedding worker")
+    from . import embeddings
+
+    embeddings.get_model()
+    if os.path.exists(address):
+        os.unlink(address)
+    batcher = _Batcher(embeddings.encode_local)
+    threading.Thread(target=batcher.run, name="embedding-batcher", daemon=True).start()
+    with Listener(address, family="AF_UNIX", authkey=AUTHKEY) as listener:
+        print(f"Embedding worker listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                print(f"Embedding worker rejected a connection: {e}")
+                continue
+            threading.Thread(target=_handle, args=(conn, batcher), daemon=True).start()
+
+
+_local = threading.local()
+_started = False
+_startup_lock = threading.Lock()
+
+
+def wait_for_startup(timeout: float = STARTUP_TIMEOUT):
+    """
+    Wait, once per process, until the worker accepts connections.
+
+    Callers arriving during the wait block until it ends; afterwards the call returns at once,
+    and a worker that cannot be reached fails fast instead of being waited for again.
+
+    Args:
+        timeout (float, optional): Seconds to wait. Defaults to STARTUP_TIMEOUT.
+    """
+    global _started
+    with _startup_lock:
+        if _started:
+            return
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                # Only probes the socket; each thread opens its own connection in _connection
+                Client(EMBEDDING_WORKER_SOCKET, family="AF_UNIX", authkey=AUTHKEY).close()
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    print(f"Embedding worker not reachable after {timeout:.0f}s.")
+                    break
+                time.sleep(0.5)
+        _started = True
+
+
+def _connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = Client(EMBEDDING_WORKER_SOCKET, family="AF_UNIX", authkey=AUTHKEY)
+        _local.conn = conn
+    return conn
+
+
+def encode_remote(texts: list, dim: int) -> np.ndarray:
+    """
+    Encode texts in the embedding worker process.
+
+    Args:
+        texts (list): List of text strings to encode.
+        dim (int): Embedding dimension.
+
+    Returns:
+        np.ndarray: Array of embeddings as float32.
+
+    Raises:
+        OSError | EOFError: If the worker cannot be reached.
+        RuntimeError: If the worker failed to encode the texts.
+    """
+    wait_for_startup()
+    shm = SharedMemory(create=True, size=max(len(texts) * dim * 4, 1))
+    try:
+        conn = _connection()
+        try:
+            conn.send((list(texts), shm.name))
+            error = conn.recv()
+        except (OSError, EOFError):
+            _local.conn = None
+            raise
+        if error:
+            raise RuntimeError(f"Embedding worker error: {error}")
+        view = np.ndarray((len(texts), dim), dtype=np.float32, buffer=shm.buf)
+        embs = view.copy()
+        del view
+        return embs
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,29 +1,144 @@
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
 from sentence_transformers import SentenceTransformer
+import json
 import numpy as np
-from . import pdf_parser
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from . import embedding_worker, leader, onnx_export, pdf_parser, profiler
+from ..vector_database import projection as projections
+from ..vector_database.projection import PCAProjection
 from ..vector_database.qdrant_store import QdrantStore
 from concurrent.futures import ThreadPoolExecutor
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = "all-MiniLM-L6-v2"
 DIM = 384
 
+# "torch" (fp32 PyTorch) or "onnx" (ONNX Runtime, dynamic int8 quantization, see onnx_export)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Minimum cosine similarity between torch and onnx embeddings to accept the onnx backend
+PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.98"))
+# Number of documents picked by the coarse (document-level) stage of search
+COARSE_TOP_DOCS = int(os.getenv("COARSE_TOP_DOCS", "3"))
+
+# Dimension of the vectors stored in Qdrant for chunk collections; 0 stores full DIM vectors
+REDUCED_DIM = int(os.getenv("REDUCED_DIM", "0"))
+# Refit the projection once a collection holds this many times the vectors it was fitted on
+REFIT_GROWTH = float(os.getenv("PROJECTION_REFIT_GROWTH", "2"))
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "RAG-Challenge/data/snapshots")
+# Comma-separated snapshot names restored at API startup (each into the session of the same name)
+SNAPSHOT_PRELOAD = os.getenv("SNAPSHOT_PRELOAD", "")
+# Attempts per preloaded snapshot while Qdrant is unreachable (delays double from 1 second)
+SNAPSHOT_PRELOAD_RETRIES = int(os.getenv("SNAPSHOT_PRELOAD_RETRIES", "6"))
+_SNAPSHOT_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def load_model(backend: str = "torch") -> SentenceTransformer:
+    """
+    Load the embedding model with the given backend.
+
+    Args:
+        backend (str, optional): "torch" or "onnx". Defaults to "torch".
+
+    Returns:
+        SentenceTransformer: The loaded embedding model.
+    """
+    if backend == "onnx":
+        return onnx_export.load_onnx(MODEL_NAME)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return SentenceTransformer(MODEL_NAME)
+
+
+def _init_model() -> SentenceTransformer:
+    if EMBEDDING_BACKEND == "torch":
+        return load_model("torch")
+    try:
+        # Parity was measured once at export time; torch is only loaded below as a fallback
+        cos = onnx_export.ensure_export(MODEL_NAME)["min_cosine"]
+        candidate = load_model(EMBEDDING_BACKEND) if cos >= PARITY_MIN_COSINE else None
+    except Exception as e:
+        print(f"Embedding backend '{EMBEDDING_BACKEND}' unavailable ({e}); using torch.")
+        return load_model("torch")
+    if candidate is None:
+        print(
+            f"Embedding backend '{EMBEDDING_BACKEND}' failed parity check "
+            f"(min cosine {cos:.4f} < {PARITY_MIN_COSINE}); using torch."
+        )
+        return load_model("torch")
+    print(f"Using '{EMBEDDING_BACKEND}' embedding backend (min cosine {cos:.4f}).")
+    return candidate
+
+
+model: SentenceTransformer | None = None
+_model_lock = threading.Lock()
+# Seconds to wait before trying an unreachable embedding worker again
+WORKER_RETRY_AFTER = 30
+_worker_down_until = 0.0
+
+
+def get_model() -> SentenceTransformer:
+    """
+    Return the in-process embedding model, loading it on first use.
+
+    Returns:
+        SentenceTransformer: The embedding model for the configured backend.
+    """
+    global model
+    with _model_lock:
+        if model is None:
+            model = _init_model()
+        return model
+
+
+# Without a shared embedding worker, load the model at startup as before
+if not embedding_worker.EMBEDDING_WORKER_SOCKET:
+    get_model()
+
 
 def ensure_store(session_id: str) -> QdrantStore:
     """
     Ensure a QdrantStore instance exists for the given session ID.
 
+    When the session's collection has a saved projection, the store searches reduced
+    vectors and rescores candidates with the full ones.
+
     Args:
         session_id (str): The session identifier.
 
     Returns:
         QdrantStore: An instance of QdrantStore for the session.
     """
-    return QdrantStore(collection=f"session_{session_id}", dim=DIM)
+    collection = f"session_{session_id}"
+    return QdrantStore(collection=collection, dim=DIM, projection=projections.load_latest(collection))
 
 
-def encode_texts(texts: list) -> np.ndarray:
+def ensure_coarse_store(session_id: str) -> QdrantStore:
     """
-    Encode a list of texts into embeddings using the SentenceTransformer model.
+    Ensure the document-level (coarse) QdrantStore exists for the given session ID.
+
+    Args:
+        session_id (str): The session identifier.
+
+    Returns:
+        QdrantStore: An instance of QdrantStore holding one vector per document.
+    """
+    return QdrantStore(collection=f"session_{session_id}_docs", dim=DIM)
+
+
+def _centroid(embs) -> np.ndarray:
+    c = np.mean(np.asarray(embs, dtype=np.float32), axis=0)
+    norm = np.linalg.norm(c)
+    return c / norm if norm > 0 else c
+
+
+def encode_local(texts: list) -> np.ndarray:
+    """
+    Encode a list of texts with the in-process SentenceTransformer model.
 
     Args:
         texts (list): List of text strings to encode.
@@ -31,7 +146,7 @@ def encode_texts(texts: list) -> np.ndarray:
     Returns:
         np.ndarray: Array of embeddings as float32.
     """
-    embs = model.encode(
+    embs = get_model().encode(
         texts,
         batch_size=64,
         convert_to_numpy=True,
@@ -40,6 +155,101 @@ def encode_texts(texts: list) -> np.ndarray:
     return embs.astype(np.float32)
 
 
+def _release_fallback():
+    global model
+    if model is not None:
+        with _model_lock:
+            model = None
+        print("Embedding worker is back; released the in-process model.")
+
+
+def encode_texts(texts: list) -> np.ndarray:
+    """
+    Encode a list of texts into embeddings.
+
+    Uses the shared embedding worker when EMBEDDING_WORKER_SOCKET is set and
+    falls back to the in-process model if the worker cannot be reached. The
+    fallback model is released once the worker answers again.
+
+    Args:
+        texts (list): List of text strings to encode.
+
+    Returns:
+        np.ndarray: Array of embeddings as float32.
+    """
+    global _worker_down_until
+    if embedding_worker.EMBEDDING_WORKER_SOCKET and time.monotonic() >= _worker_down_until:
+        try:
+            embs = embedding_worker.encode_remote(texts, DIM)
+            _release_fallback()
+            return embs
+        except (OSError, EOFError) as e:
+            _worker_down_until = time.monotonic() + WORKER_RETRY_AFTER
+            print(f"Embedding worker unavailable ({e}); encoding in-process.")
+    return encode_local(texts)
+
+
+def _ensure_store_for_ingest(session_id: str, embs) -> QdrantStore:
+    collection = f"session_{session_id}"
+    if REDUCED_DIM and embs and projections.load_latest(collection) is None:
+        existing = QdrantStore(collection=collection, dim=DIM)
+        # Only collections that start out reduced get a projection
+        if existing.count() == 0:
+            projections.save_version(collection, PCAProjection.fit(np.stack(embs), REDUCED_DIM))
+    return ensure_store(session_id)
+
+
+def _collection_lock(collection: str):
+    # Serializes writes to a reduced collection with its refits, across every API worker on the
+    # node, so no point is left in an old space
+    return leader.file_lock(f"collection-{collection}")
+
+
+def _needs_refit(proj: PCAProjection | None, count: int) -> bool:
+    return proj is not None and count >= REFIT_GROWTH * max(proj.fitted_on, 1)
+
+
+def _refit(collection: str):
+    try:
+        # Only one refit per collection at a time; other workers asking for one skip it
+        with leader.file_lock(f"refit-{collection}", blocking=False) as held:
+            if not held:
+                return
+            with _collection_lock(collection):
+                _refit_locked(collection)
+    except Exception as e:
+        print(f"Projection refit of {collection} failed: {e}")
+
+
+def _refit_locked(collection: str):
+    # Another worker may have refitted while we waited for the lock
+    proj = projections.load_latest(collection)
+    store = QdrantStore(collection=collection, dim=DIM, projection=proj)
+    if not _needs_refit(proj, store.count()):
+        return
+    gram = np.zeros((proj.in_dim, proj.in_dim), dtype=np.float64)
+    n = 0
+    for _, full in store.chunks.iter_vectors(collection):
+        full = full.astype(np.float64)
+        gram += full.T @ full
+        n += len(full)
+    refit = PCAProjection.fit_gram(gram, proj.out_dim, version=proj.version + 1, fitted_on=n)
+    try:
+        store.reproject(refit)
+    except Exception:
+        # Put the vectors back in the space of the version searches still use
+        store.reproject(proj)
+        raise
+    # Switch versions only once every stored vector is in the new space
+    projections.save_version(collection, refit)
+
+
+def _maybe_refit(store: QdrantStore):
+    if not _needs_refit(store.projection, store.count()):
+        return
+    threading.Thread(target=_refit, args=(store.collection,), name="projection-refit", daemon=True).start()
+
+
 def index_pdf(path: str, session_id: str) -> dict:
     """
     Extracts text from a PDF, encodes the text chunks, and indexes them in the vector store for the given session.
@@ -51,19 +261,23 @@ def index_pdf(path: str, session_id: str) -> dict:
     Returns:
         dict: A dictionary containing the total number of chunks and indexed points.
     """
-    store = ensure_store(session_id)
     chunks = pdf_parser.extract_text_and_chunk(path)
 
     # Parallelize text encoding
     with ThreadPoolExecutor() as executor:
         embs = list(
             executor.map(
-                lambda c: encode_texts([c["text"]])[0],
+                profiler.bind(lambda c: encode_texts([c["text"]])[0]),
                 chunks
             )
         )
 
-    store.upsert(embs, chunks)
+    with _collection_lock(f"session_{session_id}"):
+        store = _ensure_store_for_ingest(session_id, embs)
+        store.upsert(embs, chunks)
+    _maybe_refit(store)
+    if chunks:
+        ensure_coarse_store(session_id).upsert_documents([_centroid(embs)], [path])
     return {"total_chunks": len(chunks), "indexed_points": len(chunks)}
 
 
@@ -76,6 +290,9 @@ def search(
     """
     Search for relevant chunks in the vector store based on the input question.
 
+    Retrieval runs in two stages: the document-level index picks the closest
+    documents, then chunks are searched only within those documents.
+
     Args:
         question (str): The query string to search for.
         session_id (str): The session identifier.
@@ -87,4 +304,143 @@ def search(
     """
     store = ensure_store(session_id)
     q = encode_texts([question])[0]
+    if source is None:
+        # Read path: never create the document collection, and reuse its recent count
+        coarse = QdrantStore(collection=f"session_{session_id}_docs", dim=DIM, create=False)
+        if coarse.cached_count() > COARSE_TOP_DOCS:
+            source = coarse.search_documents(q, top_n=COARSE_TOP_DOCS)
     return store.search(q, top_k=top_k, source_filter=source)
+
+
+def _snapshot_path(name: str) -> str:
+    if not _SNAPSHOT_NAME.match(name) or name.startswith("."):
+        raise ValueError(f"Invalid snapshot name: {name}")
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+def list_snapshots() -> list:
+    """
+    List the snapshots available on disk.
+
+    Returns:
+        list: Snapshot names.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    return sorted(
+        d for d in os.listdir(SNAPSHOT_DIR)
+        if not d.startswith(".") and os.path.exists(os.path.join(SNAPSHOT_DIR, d, "chunks", "meta.json"))
+    )
+
+
+def snapshot_session(session_id: str, name: str) -> int:
+    """
+    Export a session's chunk and document indexes to a named snapshot.
+
+    The snapshot is written to a hidden sibling directory and swapped into place once
+    complete, so a failed export never leaves a half-written or mixed snapshot behind.
+
+    Args:
+        session_id (str): The session identifier.
+        name (str): The snapshot name.
+
+    Returns:
+        int: The number of exported chunks.
+    """
+    path = _snapshot_path(name)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{name}.", dir=SNAPSHOT_DIR)
+    try:
+        count = ensure_store(session_id).export_snapshot(os.path.join(tmp, "chunks"))
+        ensure_coarse_store(session_id).export_snapshot(os.path.join(tmp, "docs"))
+        # os.replace cannot overwrite a non-empty directory: move the old snapshot aside first
+        old = None
+        if os.path.exists(path):
+            old = tempfile.mkdtemp(prefix=f".{name}.old.", dir=SNAPSHOT_DIR)
+            os.replace(path, os.path.join(old, name))
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+    return count
+
+
+def _restore_reduced(path: str, snap: PCAProjection, collection: str) -> int:
+    # Validate everything before writing: a projection saved for vectors that were never
+    # imported (or that shadows the ones in use) would break every later search
+    if snap.in_dim != DIM:
+        raise ValueError(f"Snapshot projection expects {snap.in_dim}-dim vectors, not {DIM}")
+    existing = QdrantStore(collection=collection, dim=DIM, create=False)
+    if existing.exists() and existing.count() > 0:
+        raise ValueError(
+            f"Collection {collection} already holds vectors; restore reduced snapshots into an empty session"
+        )
+    latest = projections.load_latest(collection)
+    # Saved as a new version so it is never shadowed by, nor overwrites, an older one
+    proj = PCAProjection(snap.components, version=(latest.version + 1 if latest else 1), fitted_on=snap.fitted_on)
+    store = QdrantStore(collection=collection, dim=DIM, projection=proj)
+    try:
+        count = store.import_snapshot(path)
+    except Exception:
+        store.drop()
+        raise
+    projections.save_version(collection, proj)
+    return count
+
+
+def restore_snapshot(name: str, session_id: str) -> int:
+    """
+    Bulk-import a named snapshot into a session, without re-parsing or re-embedding.
+
+    Args:
+        name (str): The snapshot name.
+        session_id (str): The session to restore into.
+
+    Returns:
+        int: The number of restored chunks.
+    """
+    path = _snapshot_path(name)
+    if not os.path.exists(os.path.join(path, "chunks", "meta.json")):
+        raise FileNotFoundError(f"Snapshot not found: {name}")
+    collection = f"session_{session_id}"
+    proj_path = os.path.join(path, "chunks", "projection.npz")
+    with _collection_lock(collection):
+        if os.path.exists(proj_path):
+            count = _restore_reduced(os.path.join(path, "chunks"), PCAProjection.load(proj_path), collection)
+        else:
+            count = ensure_store(session_id).import_snapshot(os.path.join(path, "chunks"))
+    if os.path.exists(os.path.join(path, "docs", "meta.json")):
+        ensure_coarse_store(session_id).import_snapshot(os.path.join(path, "docs"))
+    return count
+
+
+def _holds_snapshot(name: str, session_id: str) -> bool:
+    # A session restored on an earlier start already holds exactly the snapshot's chunks
+    with open(os.path.join(_snapshot_path(name), "chunks", "meta.json"), encoding="utf-8") as f:
+        expected = json.load(f)["count"]
+    store = QdrantStore(collection=f"session_{session_id}", dim=DIM, create=False)
+    return store.exists() and store.count() == expected
+
+
+def preload_snapshots():
+    """Restore every snapshot listed in SNAPSHOT_PRELOAD into the session of the same name."""
+    for name in filter(None, (n.strip() for n in SNAPSHOT_PRELOAD.split(","))):
+        for attempt in range(SNAPSHOT_PRELOAD_RETRIES):
+            try:
+                if _holds_snapshot(name, name):
+                    print(f"Snapshot '{name}' is already loaded, skipping.")
+                    break
+                count = restore_snapshot(name, name)
+                print(f"Preloaded snapshot '{name}' ({count} chunks).")
+                break
+            except (ResponseHandlingException, UnexpectedResponse) as e:
+                # Qdrant may still be starting up
+                if attempt == SNAPSHOT_PRELOAD_RETRIES - 1:
+                    print(f"Failed to preload snapshot '{name}': {e}")
+                else:
+                    time.sleep(2 ** attempt)
+            except (OSError, ValueError) as e:
+                print(f"Failed to preload snapshot '{name}': {e}")
+                break
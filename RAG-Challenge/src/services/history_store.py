@@ -0,0 +1,128 @@
+"""SQLite store for chat history, shared by every API worker process."""
+
+from typing import Dict, Iterable, List, Tuple
+
+import os
+import sqlite3
+import threading
+import time
+
+HISTORY_STORE_PATH = os.getenv(
+    "HISTORY_STORE_PATH", "RAG-Challenge/data/chat_history.sqlite3"
+)
+
+
+class HistoryStore:
+    """Ordered chat messages per session, keeping only the most recently used sessions."""
+
+    def __init__(self, path: str = HISTORY_STORE_PATH, max_sessions: int = 256):
+        """
+        Open (or create) the SQLite database backing the history store.
+
+        Args:
+            path (str, optional): File path of the SQLite database. Defaults to HISTORY_STORE_PATH.
+            max_sessions (int, optional): Sessions kept; the least recently used are dropped. Defaults to 256.
+        """
+        self.path = path
+        self.max_sessions = max_sessions
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, seq)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> List[Tuple[int, Dict]]:
+        """
+        Fetch a session's messages in order.
+
+        Args:
+            session_id (str): The session identifier.
+
+        Returns:
+            List[Tuple[int, Dict]]: Pairs of (sequence number, message with "role" and "content").
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        return [(seq, {"role": role, "content": content}) for seq, role, content in rows]
+
+    def append(self, session_id: str, messages: Iterable[Dict], max_messages: int, keep_messages: int):
+        """
+        Append messages to a session, cutting it down to keep_messages once it exceeds max_messages.
+
+        Args:
+            session_id (str): The session identifier.
+            messages (Iterable[Dict]): Messages with "role" and "content".
+            max_messages (int): Messages a session may hold before it is cut.
+            keep_messages (int): Most recent messages kept when it is cut.
+        """
+        with self._lock, self._conn:
+            # Take the write lock up front: other API processes append to the same session
+            self._conn.execute("BEGIN IMMEDIATE")
+            (last,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = [(session_id, last + i, m["role"], m["content"]) for i, m in enumerate(messages, 1)]
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)", rows
+            )
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if count > max_messages:
+                self._conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND seq <= ?",
+                    (session_id, last + len(rows) - keep_messages),
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, updated_at) VALUES (?, ?)",
+                (session_id, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN ("
+                " SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                " SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def trim(self, session_id: str, first_seq: int):
+        """
+        Drop a session's messages older than the given sequence number.
+
+        Args:
+            session_id (str): The session identifier.
+            first_seq (int): Sequence number of the oldest message to keep.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq < ?", (session_id, first_seq)
+            )
+
+    def clear(self):
+        """Delete every stored session."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM sessions")
@@ -0,0 +1,60 @@
+"""Node-wide file locks: electing one API worker process for once-per-node background jobs,
+and serializing work that several processes may attempt at once."""
+
+from contextlib import contextmanager
+
+import fcntl
+import os
+import tempfile
+
+LOCK_DIR = os.getenv("NODE_LOCK_DIR", tempfile.gettempdir())
+_held: dict = {}
+
+
+def acquire(name: str) -> bool:
+    """
+    Try to become the process running the named job on this node.
+
+    The lock is held until the process exits; the OS then releases it, so a restarted
+    worker can take the job over.
+
+    Args:
+        name (str): The job name.
+
+    Returns:
+        bool: True if this process holds the lock.
+    """
+    if name in _held:
+        return True
+    f = open(os.path.join(LOCK_DIR, f"rag-{name}.lock"), "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _held[name] = f
+    return True
+
+
+@contextmanager
+def file_lock(name: str, blocking: bool = True):
+    """
+    Hold a node-wide exclusive lock for the duration of a with block.
+
+    Args:
+        name (str): The lock name.
+        blocking (bool, optional): Wait for the lock if another holder has it. Defaults to True.
+
+    Yields:
+        bool: True if the lock is held; False only when blocking is False and it was taken.
+    """
+    with open(os.path.join(LOCK_DIR, f"rag-{name}.lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -1,9 +1,14 @@
 import os
+import sqlite3
+import threading
 import time
+from datetime import datetime
+
 import requests
 
+OLLAMA_BASE = os.getenv("OLLAMA_HOST", "http://ollama:11434")
 # Use /api/chat (OK for Qwen Instruct)
-OLLAMA_URL = os.getenv("OLLAMA_HOST", "http://ollama:11434") + "/api/chat"
+OLLAMA_URL = OLLAMA_BASE + "/api/chat"
 # Change the default to Qwen (or let it come from docker-compose)
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:1.5b-instruct")
 
@@ -11,17 +16,214 @@ OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:1.5b-instruct")
 TIMEOUT = int(os.getenv("OLLAMA_TIMEOUT", "180"))
 RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
 BACKOFF = int(os.getenv("OLLAMA_BACKOFF", "5"))
+# Upper bound (seconds) of the delay between failed preload attempts
+MAX_PRELOAD_BACKOFF = int(os.getenv("OLLAMA_MAX_PRELOAD_BACKOFF", "300"))
+
+# Context window and reply length sent with every chat request
+NUM_CTX = 2048
+NUM_PREDICT = 512
+
+# How long Ollama keeps the model in RAM after each request
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Seconds between keep-alive pings; 0 disables the pinger
+PING_INTERVAL = int(os.getenv("OLLAMA_PING_INTERVAL", "300"))
+# Local hours (start-end, 24h) during which the pinger keeps the model resident
+BUSINESS_HOURS = os.getenv("OLLAMA_BUSINESS_HOURS", "8-18")
+# A response whose load_duration exceeds this (seconds) counts as a cold load
+COLD_LOAD_THRESHOLD = float(os.getenv("OLLAMA_COLD_LOAD_THRESHOLD", "0.5"))
+# Latency samples are kept in SQLite so /ready reports every API worker's requests
+LATENCY_STORE_PATH = os.getenv("OLLAMA_LATENCY_STORE_PATH", "RAG-Challenge/data/ollama_latency.sqlite3")
+
+
+def _in_business_hours(now: datetime | None = None) -> bool:
+    start, end = (int(h) for h in BUSINESS_HOURS.split("-"))
+    hour = (now or datetime.now()).hour
+    return start <= hour < end
+
+
+class ResidencyManager:
+    """Keeps the Ollama model loaded in RAM and tracks cold vs. warm latency."""
+
+    def __init__(self, model: str = OLLAMA_MODEL, history: int = 200, path: str = LATENCY_STORE_PATH):
+        """
+        Initialize the manager for a model.
+
+        Args:
+            model (str, optional): The Ollama model tag. Defaults to OLLAMA_MODEL.
+            history (int, optional): Number of latency samples kept per kind. Defaults to 200.
+            path (str, optional): File path of the SQLite database holding the samples.
+                Defaults to LATENCY_STORE_PATH.
+        """
+        self.model = model
+        self.state = "unloaded"
+        self.last_error: str | None = None
+        self.last_preload_s: float | None = None
+        self.history = history
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """Preload the model and start the keep-alive pinger in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-residency", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the keep-alive pinger."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        # Keep retrying the startup preload, at any hour, until the model is loaded once
+        delay = BACKOFF
+        while not self.preload():
+            if self._stop.wait(delay):
+                return
+            delay = min(delay * 2, MAX_PRELOAD_BACKOFF)
+        while PING_INTERVAL > 0 and not self._stop.wait(PING_INTERVAL):
+            if _in_business_hours():
+                self.preload()
+            else:
+                self.refresh_state()
+
+    def preload(self) -> bool:
+        """
+        Load the model into RAM (an empty generate request) and extend its keep-alive.
+
+        Returns:
+            bool: True if the model is loaded.
+        """
+        if self.state != "loaded":
+            self.state = "loading"
+        t0 = time.perf_counter()
+        try:
+            r = requests.post(
+                OLLAMA_BASE + "/api/generate",
+                json={"model": self.model, "keep_alive": KEEP_ALIVE},
+                timeout=TIMEOUT,
+            )
+            r.raise_for_status()
+            self.last_preload_s = time.perf_counter() - t0
+        except requests.RequestException as e:
+            self.state = "error"
+            self.last_error = str(e)
+            return False
+        self.state = "loaded"
+        self.last_error = None
+        return True
+
+    def refresh_state(self) -> str:
+        """
+        Ask Ollama which models are currently loaded and update the state.
+
+        Returns:
+            str: The current state ("loaded", "unloaded", "loading" or "error").
+        """
+        try:
+            r = requests.get(OLLAMA_BASE + "/api/ps", timeout=5)
+            r.raise_for_status()
+            names = {m.get("model") or m.get("name") for m in r.json().get("models", [])}
+        except requests.RequestException as e:
+            self.last_error = str(e)
+            self.state = "error"
+            return self.state
+        if self.model in names:
+            self.state = "loaded"
+        elif self.state != "loading":
+            self.state = "unloaded"
+        return self.state
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the client does not touch the disk
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS latency ("
+                " model TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " seconds REAL NOT NULL,"
+                " recorded_at REAL NOT NULL"
+                ")"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def record(self, seconds: float, load_duration_ns: int = 0):
+        """
+        Record a request latency, classified by Ollama's reported model load time.
+
+        Args:
+            seconds (float): Wall-clock latency of the request.
+            load_duration_ns (int, optional): Ollama's load_duration in nanoseconds. Defaults to 0.
+        """
+        kind = "cold" if load_duration_ns / 1e9 > COLD_LOAD_THRESHOLD else "warm"
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "INSERT INTO latency (model, kind, seconds, recorded_at) VALUES (?, ?, ?, ?)",
+                    (self.model, kind, seconds, time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM latency WHERE model = ? AND kind = ? AND rowid NOT IN ("
+                    " SELECT rowid FROM latency WHERE model = ? AND kind = ?"
+                    " ORDER BY recorded_at DESC LIMIT ?)",
+                    (self.model, kind, self.model, kind, self.history),
+                )
+
+    def stats(self) -> dict:
+        """Return count, mean, p50 and max latency (seconds) for cold and warm requests of all API workers."""
+        out = {}
+        with self._lock:
+            for kind in ("cold", "warm"):
+                rows = self._db().execute(
+                    "SELECT seconds FROM latency WHERE model = ? AND kind = ? ORDER BY recorded_at DESC LIMIT ?",
+                    (self.model, kind, self.history),
+                ).fetchall()
+                values = sorted(r[0] for r in rows)
+                out[kind] = {
+                    "count": len(values),
+                    "mean_s": sum(values) / len(values) if values else None,
+                    "p50_s": values[len(values) // 2] if values else None,
+                    "max_s": values[-1] if values else None,
+                }
+        return out
+
+
+residency = ResidencyManager()
 
 
 def query_ollama(prompt: str) -> str:
+    """Send a single user message to the model and return its reply."""
+    return chat_ollama([{"role": "user", "content": prompt}])
+
+
+def chat_ollama(messages: list[dict]) -> str:
+    """
+    Send a list of chat messages to the model and return its reply.
+
+    Args:
+        messages (list[dict]): Chat messages with "role" and "content".
+
+    Returns:
+        str: The assistant reply.
+    """
     payload = {
         "model": OLLAMA_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": messages,
         "stream": False,
+        "keep_alive": KEEP_ALIVE,
         "options": {
             "temperature": 0.3,
-            "num_predict": 512,  
-            "num_ctx": 2048, 
+            "num_predict": NUM_PREDICT,
+            "num_ctx": NUM_CTX,
             "num_thread": 4,
             "num_batch": 128,
         },
@@ -29,12 +231,15 @@ def query_ollama(prompt: str) -> str:
     last_err = None
     for attempt in range(RETRIES + 1):
         try:
+            t0 = time.perf_counter()
             r = requests.post(OLLAMA_URL, json=payload, timeout=TIMEOUT)
             if r.status_code >= 400:
                 raise requests.HTTPError(
                     f"{r.status_code} {r.reason}: {r.text}", response=r
                 )
             data = r.json()
+            residency.record(time.perf_counter() - t0, data.get("load_duration", 0))
+            residency.state = "loaded"
             return data["message"]["content"]
         except requests.RequestException as e:
             last_err = e
@@ -0,0 +1,140 @@
+"""One-off ONNX export of the embedding model, with its parity check against torch.
+
+The parity check needs the fp32 torch model as a reference, so the export runs once in a
+child process and writes its result next to the quantized model. Processes serving the
+onnx backend only read that result and load the quantized file.
+"""
+
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from . import leader
+
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "RAG-Challenge/data/onnx_models")
+# One of sentence-transformers' quantization presets: arm64, avx2, avx512, avx512_vnni
+ONNX_QUANT_CONFIG = os.getenv("ONNX_QUANT_CONFIG", "avx2")
+PARITY_SAMPLES = [
+    "How do I replace the motor bearings?",
+    "Safety instructions: disconnect the power supply before maintenance.",
+    "Tabela de dados técnicos do motor elétrico trifásico.",
+    "El equipo debe instalarse en un lugar ventilado y libre de polvo.",
+]
+
+
+def _suffix() -> str:
+    # Named after the weight type the preset produces (quint8 for avx2, qint8 for the others)
+    from optimum.onnxruntime import AutoQuantizationConfig
+
+    preset = getattr(AutoQuantizationConfig, ONNX_QUANT_CONFIG)(is_static=False)
+    return f"{preset.weights_dtype.name.lower()}_{ONNX_QUANT_CONFIG}"
+
+
+def model_dir(model_name: str) -> str:
+    """Directory holding the exported model."""
+    return os.path.join(ONNX_CACHE_DIR, model_name)
+
+
+def model_file() -> str:
+    """Path of the quantized model file, relative to model_dir."""
+    return f"onnx/model_{_suffix()}.onnx"
+
+
+def _report_path(model_name: str) -> str:
+    return os.path.join(model_dir(model_name), "onnx", f"parity_{_suffix()}.json")
+
+
+def check_parity(candidate: SentenceTransformer, reference: SentenceTransformer, texts: list = PARITY_SAMPLES) -> float:
+    """
+    Compare two models on the same texts.
+
+    Args:
+        candidate (SentenceTransformer): The model being validated.
+        reference (SentenceTransformer): The reference (torch) model.
+        texts (list, optional): Texts to encode. Defaults to PARITY_SAMPLES.
+
+    Returns:
+        float: The lowest cosine similarity between paired embeddings.
+    """
+    a = candidate.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    b = reference.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+
+def load_onnx(model_name: str) -> SentenceTransformer:
+    """
+    Load the exported, quantized model.
+
+    Args:
+        model_name (str): The sentence-transformers model name.
+
+    Returns:
+        SentenceTransformer: The model running on ONNX Runtime.
+    """
+    return SentenceTransformer(
+        model_dir(model_name), backend="onnx", model_kwargs={"file_name": model_file()}
+    )
+
+
+def export(model_name: str) -> dict:
+    """
+    Export and quantize the model in this process, then check it against torch.
+
+    Args:
+        model_name (str): The sentence-transformers model name.
+
+    Returns:
+        dict: The parity report written next to the model.
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    path = model_dir(model_name)
+    if not os.path.exists(os.path.join(path, model_file())):
+        exported = SentenceTransformer(model_name, backend="onnx")
+        exported.save_pretrained(path)
+        export_dynamic_quantized_onnx_model(exported, ONNX_QUANT_CONFIG, path, file_suffix=_suffix())
+    cos = check_parity(load_onnx(model_name), SentenceTransformer(model_name))
+    report = {"model_file": model_file(), "min_cosine": cos, "samples": len(PARITY_SAMPLES)}
+    tmp = _report_path(model_name) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f)
+    os.replace(tmp, _report_path(model_name))
+    return report
+
+
+def ensure_export(model_name: str) -> dict:
+    """
+    Return the parity report of the exported model, exporting it first if needed.
+
+    The export runs in a spawned child process, so the torch reference model never
+    stays resident in the caller, and under a node-wide lock, so concurrent callers
+    do not write the same files.
+
+    Args:
+        model_name (str): The sentence-transformers model name.
+
+    Returns:
+        dict: The parity report, with the lowest cosine similarity under "min_cosine".
+
+    Raises:
+        RuntimeError: If the export failed.
+    """
+    report = _report_path(model_name)
+
+    def exported() -> bool:
+        return os.path.exists(report) and os.path.exists(os.path.join(model_dir(model_name), model_file()))
+
+    if not exported():
+        # Several API workers may start at once; only one exports, the others wait for its files
+        with leader.file_lock("onnx-export"):
+            if not exported():
+                proc = mp.get_context("spawn").Process(target=export, args=(model_name,), name="onnx-export")
+                proc.start()
+                proc.join()
+                if proc.exitcode != 0 or not exported():
+                    raise RuntimeError(f"ONNX export failed (exit code {proc.exitcode})")
+    with open(report, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,279 @@
+"""Low-overhead stack sampling profiler for on-demand request profiling."""
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+
+import asyncio
+import functools
+import hmac
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from fastapi.routing import APIRoute
+
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+# Profiles are kept in SQLite so any API worker process can serve them
+PROFILE_STORE_PATH = os.getenv("PROFILE_STORE_PATH", "RAG-Challenge/data/profiles.sqlite3")
+# Required in the X-Admin-Token header by /admin/profiles and by header-triggered profiling;
+# when empty, both are disabled and only PROFILE_SAMPLE_RATE sampling remains
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+_TRUTHY = {"1", "true", "yes", "on"}
+
+
+def is_admin(token: str | None) -> bool:
+    """Return True if the token matches PROFILE_ADMIN_TOKEN (never when no token is configured)."""
+    return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(token or "", PROFILE_ADMIN_TOKEN)
+
+
+def header_requests_profile(value: str | None) -> bool:
+    """Return True if a profiling header value asks for a profile ("1", "true", "yes" or "on")."""
+    return (value or "").strip().lower() in _TRUTHY
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples, at a fixed interval, the Python stacks of the threads serving one request.
+
+    Code runs on behalf of the request inside track() (see ProfiledRoute and bind). Each call
+    registers its own frame under the current thread, and a thread's stack is only sampled
+    while it contains one of those frames. That also separates requests sharing the event-loop
+    thread: a suspended coroutine is not on the stack.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        """
+        Initialize the sampler.
+
+        Args:
+            interval_ms (float, optional): Milliseconds between samples. Defaults to PROFILE_INTERVAL_MS.
+        """
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # thread ident -> ids of the frames this request runs under on that thread
+        self._anchors: Dict[int, set] = {}
+        self._anchors_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @contextmanager
+    def track(self, frame):
+        """Sample the current thread while its stack contains the given frame."""
+        tid = threading.get_ident()
+        with self._anchors_lock:
+            self._anchors.setdefault(tid, set()).add(id(frame))
+        try:
+            yield
+        finally:
+            with self._anchors_lock:
+                self._anchors[tid].discard(id(frame))
+                if not self._anchors[tid]:
+                    del self._anchors[tid]
+
+    def start(self):
+        """Start sampling in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread to finish."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            with self._anchors_lock:
+                anchors = {tid: set(ids) for tid, ids in self._anchors.items()}
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            frames = sys._current_frames()
+            for tid, ids in anchors.items():
+                frame = frames.get(tid)
+                labels = []
+                tracked = False
+                while frame is not None:
+                    tracked = tracked or id(frame) in ids
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if tracked:
+                    labels.append(names.get(tid, str(tid)))
+                    self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Return the samples in folded-stack format (one "frame;frame;... count" line per stack)."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+# The sampler of the request being handled, propagated to its tasks and threadpool calls
+_active: ContextVar[StackSampler | None] = ContextVar("profile_sampler", default=None)
+
+
+def activate(sampler: StackSampler):
+    """Make the sampler the active profile of the current context; returns a token for deactivate."""
+    return _active.set(sampler)
+
+
+def deactivate(token):
+    """Restore the profile that was active before activate."""
+    _active.reset(token)
+
+
+def bind(fn):
+    """
+    Wrap a function handed to another thread (e.g. an executor) so its calls are sampled
+    with the profile active where it was wrapped.
+
+    Args:
+        fn (Callable): The function to wrap.
+
+    Returns:
+        Callable: The wrapped function, or fn itself when no profile is active.
+    """
+    sampler = _active.get()
+    if sampler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with sampler.track(sys._getframe()):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+def _tracked(endpoint):
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def run_async(*args, **kwargs):
+            sampler = _active.get()
+            if sampler is None:
+                return await endpoint(*args, **kwargs)
+            with sampler.track(sys._getframe()):
+                return await endpoint(*args, **kwargs)
+
+        return run_async
+
+    @functools.wraps(endpoint)
+    def run(*args, **kwargs):
+        sampler = _active.get()
+        if sampler is None:
+            return endpoint(*args, **kwargs)
+        with sampler.track(sys._getframe()):
+            return endpoint(*args, **kwargs)
+
+    return run
+
+
+class ProfiledRoute(APIRoute):
+    """An APIRoute whose endpoint is sampled by the active request profile, if any."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _tracked(endpoint), **kwargs)
+
+
+class ProfileBuffer:
+    """A bounded buffer holding the most recent request profiles, shared by all API processes."""
+
+    def __init__(self, size: int = PROFILE_BUFFER_SIZE, path: str = PROFILE_STORE_PATH):
+        """
+        Initialize the buffer.
+
+        Args:
+            size (int, optional): Maximum number of profiles kept. Defaults to PROFILE_BUFFER_SIZE.
+            path (str, optional): File path of the SQLite database. Defaults to PROFILE_STORE_PATH.
+        """
+        self.size = size
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the profiler does not touch the disk
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                " id TEXT PRIMARY KEY,"
+                " method TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " started_at REAL NOT NULL,"
+                " duration_s REAL NOT NULL,"
+                " samples INTEGER NOT NULL,"
+                " folded TEXT NOT NULL"
+                ")"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def add(self, method: str, path: str, duration_s: float, sampler: StackSampler) -> str:
+        """
+        Store a finished profile.
+
+        Args:
+            method (str): HTTP method of the profiled request.
+            path (str): URL path of the profiled request.
+            duration_s (float): Wall-clock duration of the request.
+            sampler (StackSampler): The stopped sampler holding the stacks.
+
+        Returns:
+            str: The id of the stored profile.
+        """
+        profile_id = uuid.uuid4().hex[:12]
+        row = (
+            profile_id, method, path, time.time() - duration_s, duration_s, sampler.samples, sampler.folded()
+        )
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+                conn.execute(
+                    "DELETE FROM profiles WHERE id IN ("
+                    " SELECT id FROM profiles ORDER BY started_at DESC LIMIT -1 OFFSET ?)",
+                    (self.size,),
+                )
+        return profile_id
+
+    def summaries(self) -> List[Dict]:
+        """Return a summary of the stored profiles, most recent first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, method, path, started_at, duration_s, samples"
+                " FROM profiles ORDER BY started_at DESC"
+            ).fetchall()
+        keys = ("id", "method", "path", "started_at", "duration_s", "samples")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def get(self, profile_id: str) -> Dict | None:
+        """Return a stored profile by id, or None if it has been evicted."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT id, method, path, started_at, duration_s, samples, folded"
+                " FROM profiles WHERE id = ?",
+                (profile_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "method", "path", "started_at", "duration_s", "samples", "folded")
+        return dict(zip(keys, row))
+
+
+profiles = ProfileBuffer()
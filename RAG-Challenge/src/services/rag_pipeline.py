@@ -1,33 +1,122 @@
 from .embeddings import search
-from .ollama_client import query_ollama
+from .history_store import HistoryStore
+from .ollama_client import chat_ollama, NUM_CTX, NUM_PREDICT
+from .pdf_parser import TOKENIZER
 from ..vector_database.qdrant_store import QdrantStore
 
 MAX_REFS_UI = 3
+# Sessions whose chat history is kept (least recently used are dropped)
+MAX_SESSIONS = 256
+# Messages (user + assistant) stored per session before the oldest are discarded
+MAX_HISTORY_MESSAGES = 40
+# When history overflows, the oldest turns are cut until this fraction of the limit is left
+COMPACT_TO = 0.5
+# Tokens reserved for chat-template overhead on top of the message contents
+TEMPLATE_MARGIN = 64
+# Tokens of the context window kept for prior turns; retrieved context is cut to fit the rest
+HISTORY_BUDGET = 512
+
+# Kept byte-identical across requests so Ollama can reuse the cached prompt prefix
+SYSTEM_PROMPT = (
+    "You are a concise assistant. Prefer using the provided *Context* to answer the *Question*. "
+    "If the *Context* (PDF) doesn’t contain the answer or doesn’t exist, answer from your own knowledge. "
+    "Do not fabricate details from the Context; if unsure, say you don't know briefly. "
+    "Reply in the same language as the Question."
+)
+
+# Shared by every API worker process, so a session can be served by any of them
+_histories = HistoryStore(max_sessions=MAX_SESSIONS)
 
 
 def new_chat():
     """Start a new chat and clear the vector database."""
     store = QdrantStore(collection="temp", dim=384)
     store.delete_all_collections()
+    _histories.clear()
     print("New chat started. All collections cleared.")
 
 
-def _build_prompt(question: str, contexts: list[dict]) -> str:
-    ctx = "\n\n".join([f"[p.{c['page']} #{c['order']}] {c['text']}" for c in contexts])
+def _count_tokens(text: str) -> int:
+    return len(TOKENIZER.encode(text))
+
+
+def _prompt_budget() -> int:
+    """Tokens available to the current user message (retrieved context and question)."""
+    return NUM_CTX - NUM_PREDICT - TEMPLATE_MARGIN - _count_tokens(SYSTEM_PROMPT) - HISTORY_BUDGET
+
+
+def _build_prompt(question: str, contexts: list[dict], budget: int | None = None) -> str:
+    """Build the user message, keeping the best-ranked contexts (the last one cut) that fit the budget."""
+    frame = f"*Context*:\n\n\n*Question*: {question}\nAnswer:"
+    remaining = (_prompt_budget() if budget is None else budget) - _count_tokens(frame)
+    parts = []
+    for c in contexts:
+        tokens = TOKENIZER.encode(f"[p.{c['page']} #{c['order']}] {c['text']}")
+        if len(tokens) > remaining:
+            if remaining > 0:
+                parts.append(TOKENIZER.decode(tokens[:remaining]))
+            break
+        parts.append(TOKENIZER.decode(tokens))
+        remaining -= len(tokens) + 1
+    ctx = "\n\n".join(parts)
     return (
-        "You are a concise assistant. Prefer using the provided *Context* to answer the *Question*. "
-        "If the *Context* (PDF) doesn’t contain the answer or doesn’t exist, answer from your own knowledge. "
-        "Do not fabricate details from the Context; if unsure, say you don't know briefly. "
-        "Reply in the same language as the Question.\n\n"
         f"*Context*:\n{ctx}\n\n"
         f"*Question*: {question}\n"
         "Answer:"
     )
 
 
+def _fit_history(history: list[dict], budget: int) -> list[dict]:
+    """
+    Return the history unchanged if it fits in the token budget, otherwise drop the oldest
+    question/answer pairs until it fits in COMPACT_TO of the budget.
+
+    Cutting in large steps keeps the message prefix identical for the following turns, so
+    Ollama can reuse its cached prompt instead of re-evaluating it after every trim.
+    """
+    sizes = [_count_tokens(m["content"]) for m in history]
+    total = sum(sizes)
+    if total <= budget:
+        return history
+    start = 0
+    while start < len(history) and total > budget * COMPACT_TO:
+        total -= sum(sizes[start:start + 2])
+        start += 2
+    return history[start:]
+
+
+def _build_messages(session_id: str, prompt: str) -> list[dict]:
+    stored = _histories.get(session_id)
+    # A fixed budget (the prompt is cut to fit around it) keeps cuts rare and the prefix stable
+    history = _fit_history([m for _, m in stored], HISTORY_BUDGET)
+    dropped = len(stored) - len(history)
+    if dropped:
+        # Persist the cut so the next turns start from the same prefix
+        _histories.trim(session_id, stored[dropped - 1][0] + 1)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _remember(session_id: str, question: str, answer: str):
+    # Store a compact turn (no retrieved context): only the latest turn differs from what was sent,
+    # so Ollama re-evaluates that turn but reuses the cached prefix before it
+    _histories.append(
+        session_id,
+        [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer},
+        ],
+        max_messages=MAX_HISTORY_MESSAGES,
+        keep_messages=int(MAX_HISTORY_MESSAGES * COMPACT_TO) // 2 * 2,
+    )
+
+
 def answer_question(question: str, session_id: str, source: str | None = None):
     """
-    Answers a question using retrieved context and a language model.
+    Answers a question using retrieved context, the session's prior turns and a language model.
 
     Args:
         question (str): The question to answer.
@@ -39,7 +128,8 @@ def answer_question(question: str, session_id: str, source: str | None = None):
     """
     ctx = search(question, session_id, top_k=6, source=source)
     prompt = _build_prompt(question, ctx)
-    answer = query_ollama(prompt)
+    answer = chat_ollama(_build_messages(session_id, prompt))
+    _remember(session_id, question, answer)
 
     ui_refs = []
     seen = set()
@@ -0,0 +1,177 @@
+"""Local SQLite store holding chunk texts (and full-size vectors) outside of Qdrant."""
+
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+CHUNK_STORE_PATH = os.getenv(
+    "CHUNK_STORE_PATH", "RAG-Challenge/data/chunk_store.sqlite3"
+)
+
+
+class ChunkStore:
+    """A compact key/value store mapping (collection, chunk id) to chunk text."""
+
+    def __init__(self, path: str = CHUNK_STORE_PATH):
+        """
+        Open (or create) the SQLite database backing the chunk store.
+
+        Args:
+            path (str, optional): File path of the SQLite database. Defaults to CHUNK_STORE_PATH.
+        """
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " collection TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " PRIMARY KEY (collection, id)"
+            ") WITHOUT ROWID"
+        )
+        # Full-dimension vectors, kept for rescoring when Qdrant holds reduced ones
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " collection TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (collection, id)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def put_many(self, collection: str, items: Iterable[Tuple[str, str]]):
+        """
+        Insert or replace chunk texts for a collection.
+
+        Args:
+            collection (str): The Qdrant collection the chunks belong to.
+            items (Iterable[Tuple[str, str]]): Pairs of (chunk id, text).
+        """
+        rows = [(collection, cid, text) for cid, text in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (collection, id, text) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def get_many(self, collection: str, ids: List[str]) -> Dict[str, str]:
+        """
+        Fetch chunk texts by id.
+
+        Args:
+            collection (str): The Qdrant collection the chunks belong to.
+            ids (List[str]): Chunk ids to look up.
+
+        Returns:
+            Dict[str, str]: Mapping of chunk id to text (missing ids are omitted).
+        """
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text FROM chunks WHERE collection = ? AND id IN ({marks})",
+                [collection, *ids],
+            ).fetchall()
+        return dict(rows)
+
+    def put_vectors(self, collection: str, items: Iterable[Tuple[str, np.ndarray]]):
+        """
+        Insert or replace full-dimension vectors for a collection.
+
+        Args:
+            collection (str): The Qdrant collection the vectors belong to.
+            items (Iterable[Tuple[str, np.ndarray]]): Pairs of (chunk id, vector).
+        """
+        rows = [
+            (collection, cid, np.asarray(vec, dtype=np.float32).tobytes())
+            for cid, vec in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (collection, id, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def get_vectors(self, collection: str, ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Fetch full-dimension vectors by id.
+
+        Args:
+            collection (str): The Qdrant collection the vectors belong to.
+            ids (List[str]): Chunk ids to look up.
+
+        Returns:
+            Dict[str, np.ndarray]: Mapping of chunk id to float32 vector (missing ids are omitted).
+        """
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, vector FROM vectors WHERE collection = ? AND id IN ({marks})",
+                [collection, *ids],
+            ).fetchall()
+        return {cid: np.frombuffer(blob, dtype=np.float32) for cid, blob in rows}
+
+    def iter_vectors(self, collection: str, batch_size: int = 1024) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """
+        Iterate over every full-dimension vector stored for a collection, in id order.
+
+        Args:
+            collection (str): The Qdrant collection.
+            batch_size (int, optional): Vectors per batch. Defaults to 1024.
+
+        Yields:
+            Tuple[List[str], np.ndarray]: The chunk ids of a batch and a matrix with one vector per row.
+        """
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, vector FROM vectors WHERE collection = ? AND id > ? ORDER BY id LIMIT ?",
+                    (collection, last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [cid for cid, _ in rows], np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+
+    def delete_collection(self, collection: str):
+        """Delete every chunk text and vector stored for the given collection."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+            self._conn.execute("DELETE FROM vectors WHERE collection = ?", (collection,))
+            self._conn.commit()
+
+    def clear(self):
+        """Delete every chunk text and vector in the store."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.commit()
+
+
+_default_store: ChunkStore | None = None
+_default_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    """Return the process-wide ChunkStore, opening it on first use."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ChunkStore()
+        return _default_store
@@ -0,0 +1,157 @@
+"""PCA projections that shrink stored vectors, persisted and versioned per collection."""
+
+import os
+import re
+import shutil
+
+import numpy as np
+
+PROJECTION_DIR = os.getenv("PROJECTION_DIR", "RAG-Challenge/data/projections")
+_VERSION_FILE = re.compile(r"^v(\d+)\.npz$")
+# Loaded projections by file path; versions are immutable once saved
+_cache: dict = {}
+
+
+class PCAProjection:
+    """A linear projection onto the top principal directions of a corpus's embeddings.
+
+    The projection is uncentered (the top eigenvectors of the raw vectors' Gram matrix XᵀX,
+    i.e. their right singular vectors), which keeps dot products between projected vectors
+    close to the original ones, as Distance.DOT needs.
+    """
+
+    def __init__(self, components: np.ndarray, version: int = 1, fitted_on: int = 0):
+        """
+        Initialize the projection.
+
+        Args:
+            components (np.ndarray): Orthonormal directions, shape (out_dim, in_dim).
+            version (int, optional): Version number within its collection. Defaults to 1.
+            fitted_on (int, optional): Number of vectors the projection was fitted on. Defaults to 0.
+        """
+        self.components = np.asarray(components, dtype=np.float32)
+        self.version = version
+        self.fitted_on = fitted_on
+
+    @property
+    def in_dim(self) -> int:
+        """Dimension of the original vectors."""
+        return self.components.shape[1]
+
+    @property
+    def out_dim(self) -> int:
+        """Dimension of the projected vectors."""
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, out_dim: int, version: int = 1) -> "PCAProjection":
+        """
+        Fit a projection on a set of vectors.
+
+        Args:
+            vectors (np.ndarray): Vectors to fit on, one per row.
+            out_dim (int): Dimension of the projected vectors.
+            version (int, optional): Version number of the new projection. Defaults to 1.
+
+        Returns:
+            PCAProjection: The fitted projection.
+        """
+        x = np.asarray(vectors, dtype=np.float64)
+        return cls.fit_gram(x.T @ x, out_dim, version=version, fitted_on=len(x))
+
+    @classmethod
+    def fit_gram(cls, gram: np.ndarray, out_dim: int, version: int = 1, fitted_on: int = 0) -> "PCAProjection":
+        """
+        Fit a projection from the Gram matrix XᵀX of the vectors, which can be accumulated
+        batch by batch without holding every vector in memory.
+
+        With fewer vectors than out_dim the trailing directions span the null space, so the
+        output dimension never depends on the corpus size.
+
+        Args:
+            gram (np.ndarray): Sum of the outer products of the vectors, shape (in_dim, in_dim).
+            out_dim (int): Dimension of the projected vectors.
+            version (int, optional): Version number of the new projection. Defaults to 1.
+            fitted_on (int, optional): Number of vectors summed into gram. Defaults to 0.
+
+        Returns:
+            PCAProjection: The fitted projection.
+        """
+        if not 0 < out_dim <= gram.shape[0]:
+            raise ValueError(f"out_dim must be between 1 and {gram.shape[0]}, got {out_dim}")
+        _, vecs = np.linalg.eigh(gram)
+        # eigh sorts eigenvalues in ascending order
+        components = vecs[:, ::-1][:, :out_dim].T
+        return cls(components, version=version, fitted_on=fitted_on)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Project vectors onto the reduced space.
+
+        Args:
+            vectors (np.ndarray): Vectors to project, one per row.
+
+        Returns:
+            np.ndarray: Projected float32 vectors, shape (n, out_dim).
+        """
+        return np.asarray(vectors, dtype=np.float32) @ self.components.T
+
+    def save(self, path: str):
+        """Write the projection to a .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, components=self.components, version=self.version, fitted_on=self.fitted_on)
+
+    @classmethod
+    def load(cls, path: str) -> "PCAProjection":
+        """Read a projection written by save."""
+        with np.load(path) as data:
+            return cls(data["components"], int(data["version"]), int(data["fitted_on"]))
+
+
+def _collection_dir(collection: str) -> str:
+    return os.path.join(PROJECTION_DIR, collection)
+
+
+def load_latest(collection: str) -> PCAProjection | None:
+    """
+    Load the newest projection saved for a collection.
+
+    Args:
+        collection (str): The Qdrant collection name.
+
+    Returns:
+        PCAProjection | None: The projection, or None if the collection has none.
+    """
+    path = _collection_dir(collection)
+    if not os.path.isdir(path):
+        return None
+    versions = [int(m.group(1)) for m in map(_VERSION_FILE.match, os.listdir(path)) if m]
+    if not versions:
+        return None
+    file = os.path.join(path, f"v{max(versions)}.npz")
+    if file not in _cache:
+        _cache[file] = PCAProjection.load(file)
+    return _cache[file]
+
+
+def save_version(collection: str, projection: PCAProjection) -> str:
+    """
+    Save a projection as a new version of a collection's projection.
+
+    Args:
+        collection (str): The Qdrant collection name.
+        projection (PCAProjection): The projection to save.
+
+    Returns:
+        str: The path of the saved file.
+    """
+    path = os.path.join(_collection_dir(collection), f"v{projection.version}.npz")
+    projection.save(path)
+    _cache.pop(path, None)
+    return path
+
+
+def clear():
+    """Delete every saved projection."""
+    _cache.clear()
+    shutil.rmtree(PROJECTION_DIR, ignore_errors=True)
@@ -8,46 +8,227 @@ from qdrant_client.models import (
     PointStruct,
     Filter,
     FieldCondition,
+    MatchAny,
     MatchValue,
+    PayloadSchemaType,
+    PointVectors,
 )
 
+import json
 import os
+import threading
+import time
 import uuid
 
+import numpy as np
+
+from . import projection as projections
+from .chunk_store import get_chunk_store
+from .projection import PCAProjection
+
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# Seconds a collection's existence and vector size are trusted without asking Qdrant again
+COLLECTION_CACHE_TTL = float(os.getenv("COLLECTION_CACHE_TTL", "30"))
+# Payload fields kept in Qdrant; chunk text lives in the ChunkStore
+PAYLOAD_KEYS = ["source", "page", "order"]
+# Maximal marginal relevance: 1.0 ranks by relevance only, lower values favour diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates fetched per requested hit for MMR to choose from
+MMR_FETCH_FACTOR = int(os.getenv("MMR_FETCH_FACTOR", "4"))
+# "page" sorts the final hits by (page, order); "relevance" keeps MMR selection order
+HIT_ORDER = os.getenv("HIT_ORDER", "page")
+# With a reduced-dimension collection, ANN candidates fetched per candidate kept after full-dimension rescoring
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+
+
+def mmr_select(query_vector, candidates: np.ndarray, k: int, lam: float = MMR_LAMBDA) -> List[int]:
+    """
+    Select a relevant but diverse subset of candidates with maximal marginal relevance.
+
+    Args:
+        query_vector (List[float]): The query vector.
+        candidates (np.ndarray): Candidate vectors, one per row.
+        k (int): Number of candidates to select.
+        lam (float, optional): Trade-off between relevance (1.0) and diversity (0.0). Defaults to MMR_LAMBDA.
+
+    Returns:
+        List[int]: Indices of the selected candidates, in selection order.
+    """
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    cand = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_vector, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    relevance = cand @ q
+    similarity = cand @ cand.T
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything already selected
+    redundancy = similarity[:, selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, n):
+        scores = lam * relevance - (1 - lam) * redundancy
+        scores[~available] = -np.inf
+        i = int(np.argmax(scores))
+        selected.append(i)
+        available[i] = False
+        np.maximum(redundancy, similarity[:, i], out=redundancy)
+    return selected
+
+
+_client: QdrantClient | None = None
+# collection name -> (vector size, time it was confirmed)
+_known_collections: Dict[str, tuple] = {}
+# collection name -> (point count, time it was counted)
+_known_counts: Dict[str, tuple] = {}
+_state_lock = threading.Lock()
+
+
+def _source_filter(source_filter: str | List[str] | None) -> Filter | None:
+    # Restricts a search to one source, or to any of a list of sources
+    if isinstance(source_filter, list):
+        match = MatchAny(any=source_filter)
+    elif source_filter:
+        match = MatchValue(value=source_filter)
+    else:
+        return None
+    return Filter(must=[FieldCondition(key="source", match=match)])
+
+
+def _dedupe(results) -> list:
+    # Drops exact (source, page, order) duplicates, keeping the best scored one
+    candidates = []
+    seen = set()
+    for r in results:
+        key = (
+            r.payload.get("source"),
+            r.payload.get("page"),
+            r.payload.get("order"),
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        candidates.append(r)
+    return candidates
+
+
+def _shared_client() -> QdrantClient:
+    global _client
+    with _state_lock:
+        if _client is None:
+            _client = QdrantClient(url=QDRANT_URL)
+        return _client
+
+
+def _known_size(collection: str) -> int | None:
+    with _state_lock:
+        entry = _known_collections.get(collection)
+    if entry and time.monotonic() - entry[1] < COLLECTION_CACHE_TTL:
+        return entry[0]
+    return None
+
+
+def _remember_collection(collection: str, size: int | None):
+    with _state_lock:
+        _known_counts.pop(collection, None)
+        if size is None:
+            _known_collections.pop(collection, None)
+        else:
+            _known_collections[collection] = (size, time.monotonic())
+
+
+def _forget_count(collection: str):
+    with _state_lock:
+        _known_counts.pop(collection, None)
 
 
 class QdrantStore:
     """A store for managing Qdrant vector database collections, upserting, and searching vectors."""  
 
-    def __init__(self, collection: str, dim: int = 384):
+    def __init__(
+        self,
+        collection: str,
+        dim: int = 384,
+        projection: PCAProjection | None = None,
+        create: bool = True,
+    ):
         """
         Initialize the QdrantStore with a collection name and vector dimension.
 
         Args:
             collection (str): The name of the Qdrant collection to use.
             dim (int, optional): The dimension of the vectors. Defaults to 384.
+            projection (PCAProjection | None, optional): If provided, Qdrant stores vectors reduced
+                with this projection and full vectors are kept in the chunk store for rescoring.
+            create (bool, optional): Create the collection if it does not exist. Defaults to True.
         """
-        self.client = QdrantClient(url=QDRANT_URL)
+        self.client = _shared_client()
         self.collection = collection
-        self.dim = dim
-        self._ensure_collection()
+        self.projection = projection
+        # Dimension of the vectors stored in Qdrant
+        self.dim = projection.out_dim if projection else dim
+        self.chunks = get_chunk_store()
+        if create:
+            self._ensure_collection()
 
     def delete_all_collections(self):
         """Deleta todas as collections do Qdrant."""
         collections = self.client.get_collections().collections
         for collection in collections:
             self.client.delete_collection(collection.name)
+        with _state_lock:
+            _known_collections.clear()
+            _known_counts.clear()
+        self.chunks.clear()
+        projections.clear()
         print("All collections deleted from Qdrant.")
 
+    def _size(self) -> int | None:
+        """Return the vector size of the collection, or None if it does not exist."""
+        size = _known_size(self.collection)
+        if size is not None:
+            return size
+        if not self.client.collection_exists(self.collection):
+            _remember_collection(self.collection, None)
+            return None
+        size = self.client.get_collection(self.collection).config.params.vectors.size
+        _remember_collection(self.collection, size)
+        return size
+
+    def exists(self) -> bool:
+        """Return True if the collection exists in Qdrant."""
+        return self._size() is not None
+
     def _ensure_collection(self):
-        if self.collection not in [
-            c.name for c in self.client.get_collections().collections
-        ]:
+        size = self._size()
+        exists = size is not None
+        if exists:
+            if size != self.dim:
+                if self.count() > 0:
+                    raise ValueError(
+                        f"Collection {self.collection} holds {size}-dim vectors, expected {self.dim}"
+                    )
+                exists = False
+        if not exists:
             self.client.recreate_collection(
                 collection_name=self.collection,
                 vectors_config=VectorParams(size=self.dim, distance=Distance.DOT),
             )
+            # Index the source key so filtered (second-stage) searches stay cheap
+            self.client.create_payload_index(
+                collection_name=self.collection,
+                field_name="source",
+                field_schema=PayloadSchemaType.KEYWORD,
+            )
+            _remember_collection(self.collection, self.dim)
+
+    def drop(self):
+        """Delete the collection together with its chunk texts and full vectors."""
+        self.client.delete_collection(self.collection)
+        _remember_collection(self.collection, None)
+        self.chunks.delete_collection(self.collection)
 
     def reset(self):
         """Reset the current collection by recreating it with the specified vector parameters."""  
@@ -55,82 +236,320 @@ class QdrantStore:
             collection_name=self.collection,
             vectors_config=VectorParams(size=self.dim, distance=Distance.DOT),
         )
+        _remember_collection(self.collection, self.dim)
+        self.chunks.delete_collection(self.collection)
 
     def upsert(self, embeddings: List[List[float]], chunks: List[Dict]):
         """
         Upsert (insert or update) vectors and their associated metadata into the Qdrant collection. 
 
+        The chunk text is written to the local chunk store keyed by point id;
+        the Qdrant payload only carries the filter keys.
+
         Args:
             embeddings (List[List[float]]): List of vector embeddings to upsert.
             chunks (List[Dict]): List of metadata dictionaries corresponding to each embedding.
         """
+        if not chunks:
+            return
         points = []
-        for emb, ch in zip(embeddings, chunks):
+        texts = []
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        if self.projection:
+            full = np.asarray(embeddings, dtype=np.float32)
+            self.chunks.put_vectors(self.collection, zip(ids, full))
+            embeddings = self.projection.transform(full).tolist()
+        for pid, emb, ch in zip(ids, embeddings, chunks):
+            texts.append((pid, ch["text"]))
             points.append(
                 PointStruct(
-                    id=str(uuid.uuid4()),
+                    id=pid,
                     vector=emb,
                     payload={
-                        "text": ch["text"],
                         "source": ch["meta"]["source"],
                         "page": ch["meta"]["page"],
                         "order": ch["meta"]["order"],
                     },
                 )
             )
+        # Text first, so a point is never searchable without its text
+        self.chunks.put_many(self.collection, texts)
         self.client.upsert(collection_name=self.collection, points=points)
+        _forget_count(self.collection)
+
+    def upsert_documents(self, embeddings: List[List[float]], sources: List[str]):
+        """
+        Upsert document-level vectors into a coarse collection.
+
+        Point ids are derived from the source, so re-indexing a document replaces its vector.
+
+        Args:
+            embeddings (List[List[float]]): One summary vector per document.
+            sources (List[str]): The document source corresponding to each vector.
+        """
+        points = [
+            PointStruct(
+                id=str(uuid.uuid5(uuid.NAMESPACE_URL, src)),
+                vector=emb,
+                payload={"source": src},
+            )
+            for emb, src in zip(embeddings, sources)
+        ]
+        self.client.upsert(collection_name=self.collection, points=points)
+        _forget_count(self.collection)
+
+    def reproject(self, projection: PCAProjection, batch_size: int = 512):
+        """
+        Replace every stored vector with its projection under a new projection version.
+
+        Full vectors are streamed back from the chunk store; payloads are left untouched.
+
+        Args:
+            projection (PCAProjection): The new projection (same output dimension).
+            batch_size (int, optional): Points updated per request. Defaults to 512.
+        """
+        for ids, full in self.chunks.iter_vectors(self.collection, batch_size):
+            self.client.update_vectors(
+                collection_name=self.collection,
+                points=[
+                    PointVectors(id=pid, vector=vec.tolist())
+                    for pid, vec in zip(ids, projection.transform(full))
+                ],
+            )
+        self.projection = projection
+
+    def count(self) -> int:
+        """Return the number of points in the collection."""
+        return self.client.count(collection_name=self.collection, exact=True).count
 
-    def search(self, query_vector, top_k=8, source_filter: str | None = None):
+    def cached_count(self) -> int:
+        """
+        Return the number of points, reusing a recent count instead of asking Qdrant.
+
+        Counts are dropped when this process writes to the collection and otherwise trusted
+        for COLLECTION_CACHE_TTL seconds. A missing collection counts as empty.
+        """
+        with _state_lock:
+            entry = _known_counts.get(self.collection)
+        if entry and time.monotonic() - entry[1] < COLLECTION_CACHE_TTL:
+            return entry[0]
+        n = self.count() if self.exists() else 0
+        with _state_lock:
+            _known_counts[self.collection] = (n, time.monotonic())
+        return n
+
+    def export_snapshot(self, path: str, batch_size: int = 1024) -> int:
+        """
+        Export every point of the collection to a local snapshot directory.
+
+        The snapshot holds ``vectors.npy`` (a contiguous float32 array, memory-mappable),
+        ``points.jsonl`` (id, payload and chunk text per row, in vector order) and ``meta.json``.
+        Reduced collections also write ``full_vectors.npy`` and ``projection.npz``.
+
+        Args:
+            path (str): Directory to write the snapshot to.
+            batch_size (int, optional): Points fetched per scroll request. Defaults to 1024.
+
+        Returns:
+            int: The number of exported points.
+        """
+        os.makedirs(path, exist_ok=True)
+        total = self.count()
+        if total == 0:
+            # numpy cannot memory-map an empty array
+            vectors = np.empty((0, self.dim), dtype=np.float32)
+            np.save(os.path.join(path, "vectors.npy"), vectors)
+        else:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(total, self.dim)
+            )
+        n = 0
+        offset = None
+        ids = []
+        with open(os.path.join(path, "points.jsonl"), "w", encoding="utf-8") as f:
+            while n < total:
+                records, offset = self.client.scroll(
+                    collection_name=self.collection,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True,
+                )
+                texts = self.chunks.get_many(self.collection, [str(r.id) for r in records])
+                for r in records[: total - n]:
+                    vectors[n] = r.vector
+                    row = {"id": str(r.id), "payload": r.payload, "text": texts.get(str(r.id))}
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    ids.append(str(r.id))
+                    n += 1
+                if offset is None:
+                    break
+        if total:
+            vectors.flush()
+        del vectors
+        self._export_projection(path, ids, batch_size)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "collection": self.collection, "dim": self.dim, "count": n}, f)
+        return n
+
+    def _export_projection(self, path: str, ids: List[str], batch_size: int):
+        if self.projection is None:
+            # Overwriting a snapshot of a reduced collection must not leave it looking reduced
+            for stale in ("projection.npz", "full_vectors.npy"):
+                if os.path.exists(os.path.join(path, stale)):
+                    os.remove(os.path.join(path, stale))
+            return
+        # Reduced collections also need their full vectors and projection to be rescored
+        self.projection.save(os.path.join(path, "projection.npz"))
+        full = np.zeros((len(ids), self.projection.in_dim), dtype=np.float32)
+        for start in range(0, len(ids), batch_size):
+            batch = self.chunks.get_vectors(self.collection, ids[start:start + batch_size])
+            for i, pid in enumerate(ids[start:start + batch_size], start):
+                if pid in batch:
+                    full[i] = batch[pid]
+        np.save(os.path.join(path, "full_vectors.npy"), full)
+
+    def import_snapshot(self, path: str, batch_size: int = 512) -> int:
+        """
+        Bulk-load a snapshot written by export_snapshot into the collection.
+
+        Args:
+            path (str): The snapshot directory.
+            batch_size (int, optional): Points sent per upload request. Defaults to 512.
+
+        Returns:
+            int: The number of imported points.
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Snapshot dim {meta['dim']} does not match collection dim {self.dim}")
+        count = meta["count"]
+        if count == 0:
+            return 0
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")[:count]
+
+        ids, payloads, texts = [], [], []
+        with open(os.path.join(path, "points.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                ids.append(row["id"])
+                payloads.append(row["payload"])
+                if row.get("text") is not None:
+                    texts.append((row["id"], row["text"]))
+
+        self.chunks.put_many(self.collection, texts)
+        full_path = os.path.join(path, "full_vectors.npy")
+        if self.projection and os.path.exists(full_path):
+            self.chunks.put_vectors(self.collection, zip(ids, np.load(full_path, mmap_mode="r")[:count]))
+        self.client.upload_collection(
+            collection_name=self.collection,
+            vectors=vectors,
+            payload=payloads,
+            ids=ids,
+            batch_size=batch_size,
+            wait=True,
+        )
+        _forget_count(self.collection)
+        return count
+
+    def search_documents(self, query_vector, top_n: int = 3) -> List[str]:
+        """
+        Search a coarse collection for the documents closest to the query.
+
+        Args:
+            query_vector (List[float]): The query vector.
+            top_n (int, optional): The number of documents to return. Defaults to 3.
+
+        Returns:
+            List[str]: Sources of the best matching documents, best first.
+        """
+        results = self.client.search(
+            collection_name=self.collection,
+            query_vector=query_vector,
+            limit=top_n,
+            with_payload=["source"],
+        )
+        return [r.payload["source"] for r in results]
+
+    def _rescore(self, query_vector, hits: List[Dict], limit: int):
+        # Rescore reduced-space candidates with their full-dimension vectors from the chunk store
+        full = self.chunks.get_vectors(self.collection, [h["id"] for h in hits])
+        hits = [h for h in hits if h["id"] in full]
+        if not hits:
+            return hits, None
+        vectors = np.stack([full[h["id"]] for h in hits])
+        scores = vectors @ np.asarray(query_vector, dtype=np.float32)
+        best = np.argsort(-scores)[:limit]
+        return [dict(hits[i], score=float(scores[i])) for i in best], vectors[best]
+
+    def search(
+        self,
+        query_vector,
+        top_k=8,
+        source_filter: str | List[str] | None = None,
+        mmr_lambda: float = MMR_LAMBDA,
+        order: str = HIT_ORDER,
+    ):
         """
         Search for the most similar vectors in the collection.
 
+        Candidates are over-fetched with their vectors, exact (source, page, order) duplicates are
+        dropped, and the final hits are picked with maximal marginal relevance so near-duplicate
+        chunks do not crowd the context. With a projection, the reduced-space candidates are first
+        rescored with their full-dimension vectors from the chunk store.
+
         Args:
             query_vector (List[float]): The query vector to search for similar vectors.
             top_k (int, optional): The number of top results to return. Defaults to 8.
-            source_filter (str, optional): If provided, filters results by the given source.
+            source_filter (str | List[str], optional): If provided, filters results by the given source(s).
+            mmr_lambda (float, optional): MMR relevance/diversity trade-off; 1.0 disables diversification.
+                Defaults to MMR_LAMBDA.
+            order (str, optional): "page" to sort hits by page and order, "relevance" to keep MMR order.
+                Defaults to HIT_ORDER.
 
         Returns:
             List[Dict]: A list of dictionaries containing the matched text, score, source, page, and order.
         """
-        flt = None
-        if source_filter:
-            flt = Filter(
-                must=[
-                    FieldCondition(
-                        key="source",
-                        match=MatchValue(value=source_filter),
-                    )
-                ]
-            )
+        fetch = top_k * MMR_FETCH_FACTOR
+        ann_query = query_vector
+        if self.projection:
+            ann_query = self.projection.transform(np.asarray(query_vector)[None])[0].tolist()
         results = self.client.search(
             collection_name=self.collection,
-            query_vector=query_vector,
-            limit=top_k * 2,  # pega sobra pra deduplicar
-            query_filter=flt,
+            query_vector=ann_query,
+            limit=fetch * RESCORE_FACTOR if self.projection else fetch,
+            query_filter=_source_filter(source_filter),
+            with_payload=PAYLOAD_KEYS,
+            with_vectors=mmr_lambda < 1.0 and not self.projection,
         )
 
-        hits = []
-        seen = set()
-        for r in results:
-            txt = r.payload["text"]
-            key = (
-                r.payload.get("source"),
-                r.payload.get("page"),
-                r.payload.get("order"),
-            )
-            if key in seen:
-                continue
-            seen.add(key)
-            hits.append(
-                {
-                    "text": txt,
-                    "score": r.score,
-                    "source": r.payload.get("source"),
-                    "page": r.payload.get("page"),
-                    "order": r.payload.get("order"),
-                }
-            )
-            if len(hits) >= top_k:
-                break
-        hits.sort(key=lambda x: (x["page"], x["order"]))
+        candidates = _dedupe(results)
+        hits = [
+            {
+                "id": str(r.id),
+                "score": r.score,
+                "source": r.payload.get("source"),
+                "page": r.payload.get("page"),
+                "order": r.payload.get("order"),
+            }
+            for r in candidates
+        ]
+        vectors = None
+        if self.projection and hits:
+            hits, vectors = self._rescore(query_vector, hits, fetch)
+        elif mmr_lambda < 1.0 and candidates:
+            vectors = np.asarray([r.vector for r in candidates], dtype=np.float32)
+
+        if mmr_lambda < 1.0 and vectors is not None and len(hits) > top_k:
+            hits = [hits[i] for i in mmr_select(query_vector, vectors, top_k, mmr_lambda)]
+        else:
+            hits = hits[:top_k]
+
+        # Hydrate text only for the selected hits
+        texts = self.chunks.get_many(self.collection, [h["id"] for h in hits])
+        for h in hits:
+            h["text"] = texts.get(h.pop("id"), "")
+        if order == "page":
+            hits.sort(key=lambda x: (x["page"], x["order"]))
         return hits